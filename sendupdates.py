@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+from requests.adapters import HTTPAdapter
+from selectolax.lexbor import LexborHTMLParser
 import os
+import csv
+import json
+import copy
+import hashlib
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import datetime
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -18,6 +25,12 @@ URLS = {
     "General Court": "https://curia.europa.eu/en/content/juris/t2_juris.htm"
 }
 
+# Shared HTTP session so both pages reuse pooled connections to curia.europa.eu;
+# the pool fits one connection per concurrent fetch and connection errors are retried
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_maxsize=len(URLS), max_retries=3))
+SESSION.headers.update({"User-Agent": "curia-monitor/1.0"})
+
 # Email configuration
 EMAIL_SENDER = os.getenv("EMAIL_SENDER")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")  # Use app password for Gmail
@@ -28,18 +41,36 @@ EMAIL_SUBJECT = "CURIA Website Update Alert"
 DATA_DIR = "permanent_data"
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Columns of the scraped tables; the first one is the unique ID
+COLUMNS = ["id", "description"]
+
+# Per-URL HTTP validators (ETag / Last-Modified) and page hashes from the previous run
+CACHE_FILE = os.path.join(DATA_DIR, "page_cache.json")
+
 # Print environment configuration (without password)
 print(f"Environment loaded from .env file")
 print(f"Email sender: {'Set' if EMAIL_SENDER else 'NOT SET'}")
 print(f"Email password: {'Set' if EMAIL_PASSWORD else 'NOT SET'}")
 print(f"Email receivers: {EMAIL_RECEIVERS if EMAIL_RECEIVERS else 'NOT SET'}")
 
-def send_email(updates):
-    """Send an email with new entries from both websites to multiple recipients"""
-    # Check if there are any non-empty DataFrames in the updates
+@contextmanager
+def smtp_session():
+    """Open an authenticated SMTP connection that is closed on exit"""
+    with smtplib.SMTP('smtp.gmail.com', 587) as server:
+        server.starttls()
+        server.login(EMAIL_SENDER, EMAIL_PASSWORD)
+        yield server
+
+def send_email(updates, server=None):
+    """Send an email with new entries from both websites to multiple recipients
+
+    Pass an open connection from smtp_session() to reuse it; otherwise one is
+    opened for this email only.
+    """
+    # Check if there are any new rows in the updates
     has_updates = False
-    for df in updates.values():
-        if df is not None and not df.empty:
+    for rows in updates.values():
+        if rows:
             has_updates = True
             break
             
@@ -48,14 +79,16 @@ def send_email(updates):
         return
     
     # Create HTML content
-    html = "<h2>New entries found on CURIA websites:</h2>"
+    parts = ["<h2>New entries found on CURIA websites:</h2>"]
     
     for court_name, new_entries in updates.items():
-        if new_entries is not None and not new_entries.empty:
-            html += f"<h3>{court_name}</h3>"
-            html += new_entries.to_html(index=False)
-            html += f"<p>Check the website: <a href='{URLS[court_name]}'>{URLS[court_name]}</a></p>"
-            html += "<hr>"
+        if new_entries:
+            parts.append(f"<h3>{court_name}</h3>")
+            parts.append(rows_to_html(new_entries))
+            parts.append(f"<p>Check the website: <a href='{URLS[court_name]}'>{URLS[court_name]}</a></p>")
+            parts.append("<hr>")
+    
+    html = "".join(parts)
     
     # Create the email message
     msg = MIMEMultipart()
@@ -69,134 +102,218 @@ def send_email(updates):
             raise ValueError("EMAIL_SENDER is not set in .env file")
         if not EMAIL_PASSWORD:
             raise ValueError("EMAIL_PASSWORD is not set in .env file")
-        if not EMAIL_RECEIVERS:
+        # Remove any whitespace and skip empty entries
+        recipients = [r.strip() for r in EMAIL_RECEIVERS if r.strip()]
+        if not recipients:
             raise ValueError("EMAIL_RECEIVERS is not set in .env file")
             
         print(f"Using sender: {EMAIL_SENDER}")
-        print(f"Recipients: {EMAIL_RECEIVERS}")
+        print(f"Recipients: {recipients}")
         
-        # Connect to the SMTP server
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(EMAIL_SENDER, EMAIL_PASSWORD)
-        
-        # Send emails to all recipients
-        for receiver in EMAIL_RECEIVERS:
-            receiver = receiver.strip()  # Remove any whitespace
-            if receiver:  # Only send if receiver is not empty
-                msg['To'] = receiver
-                server.send_message(msg)
-                print(f"Email sent successfully to {receiver}")
-                
-                # Clear the 'To' field for the next recipient
-                del msg['To']
+        # Send one message to all recipients in a single transaction,
+        # keeping them in Bcc so the list isn't disclosed (send_message strips Bcc)
+        msg['To'] = EMAIL_SENDER
+        msg['Bcc'] = ", ".join(recipients)
+        with (nullcontext(server) if server is not None else smtp_session()) as smtp:
+            smtp.send_message(msg, to_addrs=recipients)
         
-        server.quit()
-        print(f"Email updates sent successfully to {len(EMAIL_RECEIVERS)} recipients")
+        print(f"Email updates sent successfully to {len(recipients)} recipients")
     except Exception as e:
         import traceback
         print(f"Failed to send email: {str(e)}")
         print("Error details:")
         traceback.print_exc()
 
-def get_current_data(url):
-    """Scrape and parse the current data from a website"""
+def rows_to_html(rows):
+    """Render scraped rows as an HTML table for the email body"""
+    header = "".join(f"<th>{escape(column)}</th>" for column in COLUMNS)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{escape(value)}</td>" for value in row) + "</tr>"
+        for row in rows
+    )
+    return f"<table border='1'><thead><tr>{header}</tr></thead><tbody>{body}</tbody></table>"
+
+def get_current_data(url, cache=None, log=print):
+    """Scrape and parse the current data from a website
+
+    Returns a list of (id, description) rows. If a cache entry is given, the
+    request is made conditional on it and the entry is updated in place.
+    Returns None if the page has not changed. Progress messages go to log,
+    so concurrent callers can collect them instead of printing.
+    """
+    if cache is None:
+        cache = {}
+    
     try:
-        response = requests.get(url)
+        # Ask the server to skip the body if the page hasn't changed
+        request_headers = {}
+        if cache.get("etag"):
+            request_headers["If-None-Match"] = cache["etag"]
+        if cache.get("last_modified"):
+            request_headers["If-Modified-Since"] = cache["last_modified"]
+        
+        response = SESSION.get(url, headers=request_headers, timeout=30)
+        if response.status_code == 304:
+            log(f"Website not modified since last check: {url}")
+            return None
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.text, 'html.parser')
-        table = soup.find('table')
+        # Servers don't always honour conditional requests, so compare the body too
+        page_hash = hashlib.blake2b(response.content, digest_size=16).hexdigest()
+        if page_hash == cache.get("hash"):
+            log(f"Website content unchanged since last check: {url}")
+            cache["etag"] = response.headers.get("ETag")
+            cache["last_modified"] = response.headers.get("Last-Modified")
+            return None
         
-        if not table:
-            print(f"No table found on the website: {url}")
-            return pd.DataFrame()
+        # Parse the raw bytes: CURIA serves UTF-8, which lexbor assumes for bytes,
+        # whereas response.text would fall back to ISO-8859-1 and garble accents
+        tree = LexborHTMLParser(response.content)
+        table = tree.css_first('table')
         
-        # Extract table headers
-        headers = ["id", "description"]
+        if not table:
+            log(f"No table found on the website: {url}")
+            return []
         
         # Extract table rows
         rows = []
-        for tr in table.find_all('tr')[1:]:  # Skip header row
-            row = []
-            for td in tr.find_all('td'):
-                row.append(td.text.strip())
-            if row:  # Only add non-empty rows
-                rows.append(row)
+        for tr in table.css('tr')[1:]:  # Skip header row
+            row = [td.text().strip() for td in tr.css('td')]
+            if not row or not row[0]:  # Skip empty rows and rows without an ID
+                continue
+            if len(row) > len(COLUMNS):
+                log(f"Skipping row with {len(row)} columns on {url}: {row}")
+                continue
+            # Pad short rows so a malformed new case is still stored and reported
+            row += [""] * (len(COLUMNS) - len(row))
+            rows.append(tuple(row))
         
-        # Create DataFrame
-        df = pd.DataFrame(rows, columns=headers).query("id != ''")
-        print(f"Successfully scraped {len(df)} entries from {url}")
-        return df
+        log(f"Successfully scraped {len(rows)} entries from {url}")
+        
+        # Only remember the validators once the page has been parsed
+        cache["etag"] = response.headers.get("ETag")
+        cache["last_modified"] = response.headers.get("Last-Modified")
+        cache["hash"] = page_hash
+        return rows
     
     except Exception as e:
-        print(f"Error scraping website {url}: {str(e)}")
-        return pd.DataFrame()
+        log(f"Error scraping website {url}: {str(e)}")
+        return []
+
+def load_page_cache():
+    """Load the HTTP validators and page hashes saved by the previous run"""
+    if not os.path.exists(CACHE_FILE):
+        return {}
+    try:
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading page cache, ignoring it: {str(e)}")
+        return {}
+
+def save_page_cache(cache):
+    """Save the HTTP validators and page hashes for the next run"""
+    with open(CACHE_FILE, "w") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
 
 def get_data_filename(court_name):
     """Generate a filename for storing data for a specific court"""
     return os.path.join(DATA_DIR, f"{court_name.replace(' ', '_').lower()}_data.csv")
 
+def read_data(data_file):
+    """Load stored data, returning its header and rows"""
+    with open(data_file, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        # Skip blank lines, as pandas.read_csv did
+        return header, [tuple(row) for row in reader if row]
+
+def write_data(data_file, rows):
+    """Store data in the same CSV layout as the permanent data files"""
+    with open(data_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
 def check_for_updates():
     """Check for updates on all websites and save current data for future comparisons"""
     updates = {}
+    page_cache = load_page_cache()
+    loaded_cache = copy.deepcopy(page_cache)
     
+    # Without reference data a "not modified" answer is useless, so fetch in full
     for court_name, url in URLS.items():
+        if not os.path.exists(get_data_filename(court_name)):
+            page_cache.pop(url, None)
+    caches = [page_cache.setdefault(url, {}) for url in URLS.values()]
+    
+    # The pages are independent, so fetch them concurrently; each worker
+    # collects its messages so they can be printed in order afterwards
+    print(f"Fetching {len(URLS)} websites")
+    logs = {court_name: [] for court_name in URLS}
+    log_funcs = [logs[court_name].append for court_name in URLS]
+    with ThreadPoolExecutor(max_workers=len(URLS)) as executor:
+        results = dict(zip(URLS, executor.map(get_current_data, URLS.values(), caches, log_funcs)))
+    
+    for court_name, current_data in results.items():
         print(f"Checking for updates on {court_name} website")
-        current_data = get_current_data(url)
+        for message in logs[court_name]:
+            print(message)
         data_file = get_data_filename(court_name)
         
-        if current_data.empty:
-            print(f"No data retrieved from {court_name} website")
+        if current_data is None:
+            print(f"No new entries found for {court_name}")
             updates[court_name] = None
             continue
         
-        # Ensure we have columns to work with
-        if len(current_data.columns) == 0:
-            print(f"No columns found in data for {court_name}")
+        if not current_data:
+            print(f"No data retrieved from {court_name} website")
             updates[court_name] = None
             continue
-            
+        
         # Use the first column as unique ID
-        id_column = current_data.columns[0]
+        id_column = COLUMNS[0]
         print(f"Using '{id_column}' as unique identifier")
         
         # Load previous data if exists
         if os.path.exists(data_file):
             try:
-                previous_data = pd.read_csv(data_file)
+                previous_columns, previous_data = read_data(data_file)
                 
                 # Check if the ID column exists in previous data
-                if id_column not in previous_data.columns:
+                if id_column not in previous_columns:
                     print(f"ID column '{id_column}' not found in previous data. Creating new reference data.")
-                    current_data.to_csv(data_file, index=False)
+                    write_data(data_file, current_data)
                     print(f"Created new reference data with {len(current_data)} entries")
                     updates[court_name] = current_data
                     continue
                 
-                # Convert ID columns to strings for comparison
-                current_ids = set(current_data[id_column].astype(str))
-                previous_ids = set(previous_data[id_column].astype(str))
+                # Compare the ID columns
+                id_index = previous_columns.index(id_column)
+                current_ids = {row[0] for row in current_data}
+                previous_ids = {row[id_index] for row in previous_data if len(row) > id_index}
                 
                 # Find new entries
                 new_ids = current_ids - previous_ids
                 
                 if new_ids:
                     # Find rows with new IDs
-                    new_entries = current_data[current_data[id_column].astype(str).isin(new_ids)]
+                    new_entries = [row for row in current_data if row[0] in new_ids]
                     
                     print(f"Found {len(new_entries)} new entries for {court_name}")
                     updates[court_name] = new_entries
                     
                     # Update reference file with all current data
-                    current_data.to_csv(data_file, index=False)
+                    write_data(data_file, current_data)
                     print(f"Updated reference data with {len(current_data)} total entries")
                 else:
                     print(f"No new entries found for {court_name}")
-                    updates[court_name] = pd.DataFrame(columns=current_data.columns)
+                    updates[court_name] = []
                     
-                    # Still save current data to keep timestamps updated
-                    current_data.to_csv(data_file, index=False)
+                    # Only rewrite the reference file if entries were changed or removed
+                    if previous_columns != COLUMNS or previous_data != current_data:
+                        write_data(data_file, current_data)
+                        print(f"Updated reference data with {len(current_data)} total entries")
                     
             except Exception as e:
                 print(f"Error processing previous data: {str(e)}")
@@ -205,17 +322,22 @@ def check_for_updates():
                 print("Creating new reference data...")
                 
                 # Save current data as reference
-                current_data.to_csv(data_file, index=False)
+                write_data(data_file, current_data)
                 print(f"Created new reference data with {len(current_data)} entries")
                 updates[court_name] = current_data
         else:
             print(f"No previous data file found for {court_name}. Creating new reference data.")
             
             # Save current data as reference
-            current_data.to_csv(data_file, index=False)
+            write_data(data_file, current_data)
             print(f"Created new reference data with {len(current_data)} entries")
             updates[court_name] = current_data
     
+    # Only touch the cache file if something changed, so quiet days leave no commit
+    page_cache = {url: entry for url, entry in page_cache.items() if entry}
+    if page_cache != loaded_cache:
+        save_page_cache(page_cache)
+    
     # Send email with all updates
     send_email(updates)
     